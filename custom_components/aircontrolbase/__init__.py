@@ -9,7 +9,7 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .api import AirControlBaseAPI, AirControlBaseConnectionError, AirControlBaseAuthError, AirControlBaseError
@@ -27,7 +27,9 @@ PLATFORMS = [Platform.CLIMATE]
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up AirControlBase from a config entry."""
-    session = async_get_clientsession(hass)
+    # Dedicated session so the login cookie stays out of the shared cookie jar
+    session = async_create_clientsession(hass)
+    entry.async_on_unload(session.close)
     api = AirControlBaseAPI(
         entry.data["email"],
         entry.data["password"],
@@ -86,6 +88,7 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+        await entry_data["api"].aclose()
 
     return unload_ok
\ No newline at end of file
@@ -1,12 +1,30 @@
 """AirControlBase API Client."""
 import logging
+import asyncio
 import aiohttp
-import async_timeout
-from typing import Any, Dict, List, Optional
-import time
-import json
+from typing import Any, Dict, List, Optional, Tuple
+from itertools import chain
+
+import orjson
+from yarl import URL
 
 _LOGGER = logging.getLogger(__name__)
+
+_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Attempts and base backoff in seconds for idempotent requests hitting transient errors
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 0.25
+_RETRY_STATUSES = frozenset({502, 503, 504})
+
+# Window in seconds during which control operations for one device are merged
+CONTROL_BATCH_DELAY = 0.15
+
+_OK_CODES = frozenset({"200", 200})
+_OK_MSG = "操作成功"  # "Operation successful" in Chinese
+_AUTH_FAIL_CODES = frozenset({"401", 401, "403", 403})
+_SESSION_EXPIRED_MSGS = frozenset({"token expired", "session expired", "请重新登录"})  # "Please log in again"
+
 class AirControlBaseError(Exception):
     """Base exception for AirControlBase."""
 
@@ -16,26 +34,68 @@ class AirControlBaseAuthError(AirControlBaseError):
 class AirControlBaseConnectionError(AirControlBaseError):
     """Exception for connection errors."""
 
+class _TransientConnectionError(AirControlBaseConnectionError):
+    """Connection error that is worth retrying for idempotent requests."""
+
 class AirControlBaseAPI:
     """AirControlBase API Client."""
 
+    _DEFAULT_HEADERS = {
+        "Connection": "keep-alive",
+        "User-Agent": "HA-aircontrolbase/1.0",
+    }
+    _FORM_HEADERS = {
+        **_DEFAULT_HEADERS,
+        "Content-Type": "application/x-www-form-urlencoded",
+    }
+
     def __init__(
         self,
         email: str,
         password: str,
-        session: aiohttp.ClientSession,
+        session: Optional[aiohttp.ClientSession] = None,
         avoid_refresh_status_on_update_in_ms: int = 5000,
     ) -> None:
         """Initialize the API client."""
         self._email = email
         self._password = password
         self._session = session
-        self._base_url = "https://www.aircontrolbase.com"
+        self._own_session = session is None
+        base_url = URL("https://www.aircontrolbase.com")
+        self._url_login = base_url / "web/user/login"
+        self._url_control = base_url / "web/device/control"
+        self._url_details = base_url / "web/userGroup/getDetails"
         self._user_id = None
-        self._session_id = None
-        self._last_update_time = 0
+        self._authenticated = False
+        self._last_update_monotonic: Optional[float] = None
+        self._cached_devices: List[Dict[str, Any]] = []
+        self._inflight: Optional["asyncio.Task[List[Dict[str, Any]]]"] = None
+        self._pending_controls: Dict[Any, Tuple[Dict[str, Any], "asyncio.Task[None]"]] = {}
         self._avoid_refresh_status_on_update_in_ms = avoid_refresh_status_on_update_in_ms
 
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the HTTP session, creating a pooled one if none was provided."""
+        if self._session is None or self._session.closed:
+            # Keep TLS connections to the API host alive between polls and controls;
+            # the default cookie jar carries the login session cookie
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=10,
+                    limit_per_host=4,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True,
+                ),
+                timeout=_REQUEST_TIMEOUT,
+            )
+            self._own_session = True
+        return self._session
+
+    async def aclose(self) -> None:
+        """Close the HTTP session if it is owned by this client."""
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
     async def login(self) -> None:
         """Login to AirControlBase."""
         data = {
@@ -47,173 +107,227 @@ class AirControlBaseAPI:
         _LOGGER.debug("Attempting login to AirControlBase with email: %s", self._email)
         
         try:
+            session = await self._get_session()
             # Use form data (this is what works!)
-            async with async_timeout.timeout(10):
-                async with self._session.post(
-                    f"{self._base_url}/web/user/login",
-                    data=data,  # Use form data, not JSON
-                ) as response:
-                    _LOGGER.debug("Login response status: %s", response.status)
+            async with session.post(
+                self._url_login,
+                data=data,  # Use form data, not JSON
+                headers=self._DEFAULT_HEADERS,
+                timeout=_REQUEST_TIMEOUT,
+            ) as response:
+                _LOGGER.debug("Login response status: %s", response.status)
+                if _LOGGER.isEnabledFor(logging.DEBUG):
                     _LOGGER.debug("Login response headers: %s", dict(response.headers))
+                
+                if response.status in (401, 403):
+                    raise AirControlBaseAuthError(f"HTTP error {response.status}")
+                if response.status != 200:
+                    raise AirControlBaseConnectionError(f"Authentication failed: HTTP error {response.status}")
+                
+                raw = await response.read()
+                try:
+                    result = orjson.loads(raw)
+                except orjson.JSONDecodeError as e:
+                    _LOGGER.error("Failed to parse JSON response: %s. Raw response: %s", e, raw.decode(errors="replace"))
+                    raise AirControlBaseConnectionError(f"Authentication failed: Invalid response format: {e}") from e
+                
+                _LOGGER.debug("Login response: %s", result)
+                
+                # Check for success (code "200" for form data)
+                if result.get("code") in _OK_CODES or result.get("msg") == _OK_MSG:
                     
-                    if response.status in (401, 403):
-                        raise AirControlBaseAuthError(f"HTTP error {response.status}")
-                    if response.status != 200:
-                        raise AirControlBaseConnectionError(f"HTTP error {response.status}")
+                    # Extract user ID from result
+                    if "result" in result and "id" in result["result"]:
+                        self._user_id = result["result"]["id"]
+                    else:
+                        _LOGGER.error("No user ID found in response: %s", result)
+                        raise AirControlBaseAuthError("No user ID in response")
                     
-                    try:
-                        result = await response.json()
-                    except Exception as e:
-                        text_result = await response.text()
-                        _LOGGER.error("Failed to parse JSON response: %s. Raw response: %s", e, text_result)
-                        raise Exception(f"Invalid response format: {e}")
+                    # A cookie set without Path=/ defaults to /web/user and would never
+                    # reach the other endpoints, so re-store it for the whole site; the
+                    # cookie jar then sends it automatically with subsequent requests
+                    if response.cookies:
+                        session.cookie_jar.update_cookies(
+                            {name: morsel.value for name, morsel in response.cookies.items()},
+                            self._url_login.origin(),
+                        )
+                    else:
+                        _LOGGER.warning("No session cookies found")
+                    self._authenticated = True
                     
-                    _LOGGER.debug("Login response: %s", result)
+                    _LOGGER.info("Successfully logged in to AirControlBase (User ID: %s)", self._user_id)
+                else:
+                    error_msg = result.get('msg') or result.get('message') or f"Unknown error (code: {result.get('code')})"
+                    _LOGGER.error("Login failed: %s", error_msg)
+                    raise AirControlBaseAuthError(f"Login failed: {error_msg}")
                     
-                    # Check for success (code "200" for form data)
-                    if (result.get("code") == "200" or 
-                        result.get("code") == 200 or
-                        result.get("msg") == "操作成功"):  # "Operation successful" in Chinese
-                        
-                        # Extract user ID from result
-                        if "result" in result and "id" in result["result"]:
-                            self._user_id = result["result"]["id"]
-                        else:
-                            _LOGGER.error("No user ID found in response: %s", result)
-                            raise AirControlBaseAuthError("No user ID in response")
-                        
-                        # Extract session cookie
-                        cookies = response.headers.getall('Set-Cookie', [])
-                        if cookies:
-                            self._session_id = '; '.join(cookies)
-                        else:
-                            _LOGGER.warning("No session cookies found")
-                            self._session_id = ""
-                        
-                        _LOGGER.info("Successfully logged in to AirControlBase (User ID: %s)", self._user_id)
-                    else:
-                        error_msg = result.get('msg') or result.get('message') or f"Unknown error (code: {result.get('code')})"
-                        _LOGGER.error("Login failed: %s", error_msg)
-                        raise AirControlBaseAuthError(f"Login failed: {error_msg}")
-                        
-        except AirControlBaseAuthError:
-            raise
-        except Exception as e:
+        except asyncio.TimeoutError as e:
+            _LOGGER.error("Login timed out")
+            raise AirControlBaseConnectionError("Authentication failed: timeout") from e
+        except aiohttp.ClientError as e:
             _LOGGER.error("Login exception: %s", e)
-            raise AirControlBaseConnectionError(f"Authentication failed: {e}")
+            raise AirControlBaseConnectionError(f"Authentication failed: {e}") from e
+
+    async def _request(
+        self, url: URL, data: Dict[str, Any], retry: bool = True, idempotent: bool = False
+    ) -> Dict[str, Any]:
+        """Centralized request method with automatic re-authentication.
 
-    async def _request(self, endpoint: str, data: Dict[str, Any], retry: bool = True) -> Dict[str, Any]:
-        """Centralized request method with automatic re-authentication."""
+        Idempotent requests are retried with exponential backoff on transient
+        connection errors; others are sent once so a device is never actuated twice.
+        """
+        attempts = RETRY_ATTEMPTS if idempotent else 1
+        for attempt in range(attempts - 1):
+            try:
+                return await self._request_once(url, data, retry)
+            except _TransientConnectionError as e:
+                delay = RETRY_DELAY * 2**attempt
+                _LOGGER.warning("Request to %s failed (%s), retrying in %.2fs", url.path, e, delay)
+                await asyncio.sleep(delay)
+        return await self._request_once(url, data, retry)
+
+    async def _request_once(self, url: URL, data: Dict[str, Any], retry: bool = True) -> Dict[str, Any]:
+        """Send a single request, re-authenticating once if the session expired."""
         if not self._user_id:
             await self.login()
 
-        url = f"{self._base_url}{endpoint}"
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-        }
-        if self._session_id:
-            headers["Cookie"] = self._session_id
-
         try:
-            async with async_timeout.timeout(10):
-                async with self._session.post(url, data=data, headers=headers) as response:
-                    _LOGGER.debug("%s response status: %s", endpoint, response.status)
-
-                    if response.status in (401, 403):
-                        if retry:
-                            _LOGGER.warning("Unauthorized (%s). Attempting re-authentication...", response.status)
-                            self._user_id = None
-                            self._session_id = None
-                            await self.login()
-                            return await self._request(endpoint, data, retry=False)
-                        raise AirControlBaseAuthError(f"HTTP error {response.status}")
-
-                    if response.status != 200:
-                        raise AirControlBaseConnectionError(f"HTTP error {response.status}")
-
-                    result = await response.json()
-                    _LOGGER.debug("%s response: %s", endpoint, result)
-
-                    # Check for "session expired" or "not logged in" messages/codes
-                    # Some APIs return 200 but with an error code in the body
-                    code = result.get("code")
-                    if (code in ("401", 401, "403", 403) or 
-                        result.get("msg") in ("token expired", "session expired", "请重新登录")): # "Please log in again"
-                        if retry:
-                            _LOGGER.warning("Session expired (code %s). Attempting re-authentication...", code)
-                            self._user_id = None
-                            self._session_id = None
-                            await self.login()
-                            return await self._request(endpoint, data, retry=False)
-                        error_msg = result.get('msg') or "Session expired"
-                        raise AirControlBaseAuthError(f"Authentication failed: {error_msg}")
-
-                    if not (code in ("200", 200) or result.get("msg") == "操作成功"):
-                        error_msg = result.get('msg') or result.get('message') or f"Unknown error (code: {code})"
-                        raise AirControlBaseError(f"API error: {error_msg}")
-
-                    return result
-        except (AirControlBaseAuthError, AirControlBaseError):
-            raise
-        except Exception as e:
-            _LOGGER.error("Request to %s failed: %s", endpoint, e)
-            raise AirControlBaseConnectionError(f"Request failed: {e}")
+            async with (await self._get_session()).post(
+                url, data=data, headers=self._FORM_HEADERS, timeout=_REQUEST_TIMEOUT
+            ) as response:
+                _LOGGER.debug("%s response status: %s", url.path, response.status)
+                if _LOGGER.isEnabledFor(logging.DEBUG) and response.connection is not None:
+                    _LOGGER.debug("%s served over transport %s", url.path, id(response.connection.transport))
+
+                if response.status in (401, 403):
+                    if retry:
+                        _LOGGER.warning("Unauthorized (%s). Attempting re-authentication...", response.status)
+                        self._user_id = None
+                        self._authenticated = False
+                        await self.login()
+                        return await self._request_once(url, data, retry=False)
+                    raise AirControlBaseAuthError(f"HTTP error {response.status}")
+
+                if response.status in _RETRY_STATUSES:
+                    raise _TransientConnectionError(f"HTTP error {response.status}")
+                if response.status != 200:
+                    raise AirControlBaseConnectionError(f"HTTP error {response.status}")
+
+                result = orjson.loads(await response.read())
+                _LOGGER.debug("%s response: %s", url.path, result)
+
+                # Check for "session expired" or "not logged in" messages/codes
+                # Some APIs return 200 but with an error code in the body
+                code = result.get("code")
+                if code in _AUTH_FAIL_CODES or result.get("msg") in _SESSION_EXPIRED_MSGS:
+                    if retry:
+                        _LOGGER.warning("Session expired (code %s). Attempting re-authentication...", code)
+                        self._user_id = None
+                        self._authenticated = False
+                        await self.login()
+                        return await self._request_once(url, data, retry=False)
+                    error_msg = result.get('msg') or "Session expired"
+                    raise AirControlBaseAuthError(f"Authentication failed: {error_msg}")
+
+                if not (code in _OK_CODES or result.get("msg") == _OK_MSG):
+                    error_msg = result.get('msg') or result.get('message') or f"Unknown error (code: {code})"
+                    raise AirControlBaseError(f"API error: {error_msg}")
+
+                return result
+        except asyncio.TimeoutError as e:
+            _LOGGER.error("Request to %s timed out", url.path)
+            raise _TransientConnectionError("Request failed: timeout") from e
+        except (aiohttp.ClientOSError, aiohttp.ServerDisconnectedError) as e:
+            # Connect failures (ClientConnectorError is a ClientOSError) and pooled
+            # keep-alive sockets the server already closed
+            _LOGGER.error("Request to %s failed: %s", url.path, e)
+            raise _TransientConnectionError(f"Request failed: {e}") from e
+        except (aiohttp.ClientError, orjson.JSONDecodeError) as e:
+            _LOGGER.error("Request to %s failed: %s", url.path, e)
+            raise AirControlBaseConnectionError(f"Request failed: {e}") from e
 
     async def control_device(self, control: Dict[str, Any], operation: Dict[str, Any]) -> None:
-        """Control a device."""
-        self._last_update_time = int(time.time() * 1000)
-        
-        # Convert operation to JSON string for form encoding
-        # The original code seemed to use 'operation' for both 'control' and 'operation' fields in form_data
-        # but the filtered_control logic suggested it might want more. 
-        # Keeping consistent with the working implementation I see in the file lines 114-117.
+        """Control a device.
+
+        Operations for the same device issued within CONTROL_BATCH_DELAY are merged
+        and sent as one request; every caller waits for that request to finish.
+        """
+        self._last_update_monotonic = asyncio.get_running_loop().time()
+
+        key = operation.get("id")
+        pending = self._pending_controls.get(key)
+        if pending is None:
+            pending = ({}, asyncio.create_task(self._flush_control(key)))
+            self._pending_controls[key] = pending
+        # Later operations win, so the flushed state is always the latest one
+        pending[0].update(operation)
+        await asyncio.shield(pending[1])
+
+    async def _flush_control(self, key: Any) -> None:
+        """Send the merged operation for a device once the batch window closes."""
+        await asyncio.sleep(CONTROL_BATCH_DELAY)
+        operation, _ = self._pending_controls.pop(key)
+
+        # The API expects the operation JSON in both the 'control' and 'operation' fields,
+        # so serialize it once and reuse the string.
+        op_json = orjson.dumps(operation).decode()
         form_data = {
             "userId": self._user_id if self._user_id else "", # _request will handle login if empty
-            "control": json.dumps(operation),
-            "operation": json.dumps(operation),
+            "control": op_json,
+            "operation": op_json,
         }
 
-        await self._request("/web/device/control", form_data)
+        await self._request(self._url_control, form_data)
 
     async def get_devices(self) -> List[Dict[str, Any]]:
         """Get all devices."""
         if (
-            self._last_update_time > 0
-            and int(time.time() * 1000) - self._last_update_time
-            < self._avoid_refresh_status_on_update_in_ms
+            self._last_update_monotonic is not None
+            and asyncio.get_running_loop().time() - self._last_update_monotonic
+            < self._avoid_refresh_status_on_update_in_ms / 1000.0
         ):
-            return []
+            # Hand out the last known devices rather than an empty list, copied so
+            # callers cannot mutate the cache
+            return list(self._cached_devices)
+
+        # Concurrent callers share a single in-flight getDetails request
+        task = self._inflight
+        if task is None:
+            task = self._inflight = asyncio.create_task(self._fetch_devices())
+            task.add_done_callback(self._clear_inflight)
+        return list(await asyncio.shield(task))
 
+    async def _fetch_devices(self) -> List[Dict[str, Any]]:
+        """Fetch the device list from the API and refresh the cache."""
         data = {"userId": self._user_id if self._user_id else ""}
         
-        result = await self._request("/web/userGroup/getDetails", data)
+        result = await self._request(self._url_details, data, idempotent=True)
         
-        all_devices = []
-        if result.get("result", {}).get("areas"):
-            for area in result["result"]["areas"]:
-                all_devices.extend(area.get("data", []))
+        all_devices = self._parse_devices(result)
         _LOGGER.debug("Parsed devices: %s", all_devices)
+        self._cached_devices = all_devices
         return all_devices
 
+    def _clear_inflight(self, task: "asyncio.Task[List[Dict[str, Any]]]") -> None:
+        """Forget a finished device fetch so the next call starts a new one."""
+        if self._inflight is task:
+            self._inflight = None
+
+    @staticmethod
+    def _parse_devices(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Flatten the devices of every area in a getDetails response."""
+        areas = result.get("result", {}).get("areas") or ()
+        return list(chain.from_iterable(area.get("data", ()) for area in areas))
+
     async def getDetails(self) -> List[Dict[str, Any]]:
         """Fetch device details from the API."""
-        data = {"userId": self._user_id if self._user_id else ""}
-        
-        result = await self._request("/web/userGroup/getDetails", data)
-
-        all_devices = []
-        if result.get("result", {}).get("areas"):
-            for area in result["result"]["areas"]:
-                all_devices.extend(area.get("data", []))
-        _LOGGER.debug("Parsed devices: %s", all_devices)
-        return all_devices
+        return await self.get_devices()
 
     async def test_connection(self) -> bool:
         """Test if the connection and authentication are working."""
         try:
+            # A successful login already proves connectivity and credentials
             await self.login()
-            # Try to get devices to fully test the connection
-            devices = await self.get_devices()
             return True
         except Exception as e:
             _LOGGER.error("Connection test failed: %s", e)
@@ -221,6 +335,6 @@ class AirControlBaseAPI:
 
     async def ensure_authenticated(self) -> None:
         """Ensure the API client is authenticated."""
-        if not self._user_id or not self._session_id:
+        if not self._user_id or not self._authenticated:
             _LOGGER.warning("Session expired or not authenticated. Re-authenticating...")
             await self.login()
\ No newline at end of file
@@ -9,7 +9,6 @@ import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.const import CONF_EMAIL, CONF_PASSWORD
 from homeassistant.data_entry_flow import FlowResult
-from homeassistant.helpers import aiohttp_client
 
 from .api import AirControlBaseAPI, AirControlBaseConnectionError, AirControlBaseAuthError
 from .const import DOMAIN, CONF_REFRESH_DELAY, DEFAULT_REFRESH_DELAY
@@ -29,17 +28,22 @@ class AirControlBaseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         if user_input is not None:
             try:
-                session = aiohttp_client.async_get_clientsession(self.hass)
+                # No shared session: the client's own session keeps the login
+                # cookie out of Home Assistant's global cookie jar
                 api = AirControlBaseAPI(
                     user_input[CONF_EMAIL],
                     user_input[CONF_PASSWORD],
-                    session,
                 )
                 
                 _LOGGER.debug("Testing authentication for: %s", user_input[CONF_EMAIL])
                 
                 # Test the connection
-                if await api.test_connection():
+                try:
+                    connected = await api.test_connection()
+                finally:
+                    await api.aclose()
+
+                if connected:
                     _LOGGER.info("Authentication successful for: %s", user_input[CONF_EMAIL])
                     return self.async_create_entry(
                         title=user_input[CONF_EMAIL],
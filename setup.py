@@ -6,6 +6,7 @@ setup(
     packages=find_packages(),
     install_requires=[
         "aiohttp",
-        "async_timeout",
+        "orjson",
+        "yarl",
     ],
 ) 
\ No newline at end of file
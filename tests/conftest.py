@@ -1,5 +1,7 @@
+import json
 import sys
-from unittest.mock import MagicMock
+from collections import deque
+from unittest.mock import AsyncMock, MagicMock, call
 
 # Mock Home Assistant modules before importing anything that depends on them
 mock_hass = MagicMock()
@@ -17,17 +19,90 @@ import pytest
 import aiohttp
 from custom_components.aircontrolbase.api import AirControlBaseAPI
 
-@pytest_asyncio.fixture
+_FAST_TIMEOUT = aiohttp.ClientTimeout(total=0.1, connect=0.1)
+
+@pytest.fixture(scope="session", autouse=True)
+def fast_api_timings():
+    """Make any unmocked request fail fast and drop retry and batch delays."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("custom_components.aircontrolbase.api._REQUEST_TIMEOUT", _FAST_TIMEOUT)
+        mp.setattr("custom_components.aircontrolbase.api.RETRY_DELAY", 0)
+        mp.setattr("custom_components.aircontrolbase.api.CONTROL_BATCH_DELAY", 0)
+        yield
+
+@pytest_asyncio.fixture(scope="session")
 async def session():
-    """Create an aiohttp session for testing."""
-    async with aiohttp.ClientSession() as session:
+    """Create one aiohttp session shared by the whole test run."""
+    async with aiohttp.ClientSession(timeout=_FAST_TIMEOUT) as session:
         yield session
 
-@pytest_asyncio.fixture
+@pytest_asyncio.fixture(scope="session")
 async def api_client(session):
-    """Create a mock AirControlBaseAPI client."""
+    """Create a mock AirControlBaseAPI client shared by the whole test run."""
     return AirControlBaseAPI(
         email="test@example.com",
         password="password123",
         session=session,
     )
+
+class _ACM:
+    """Minimal async context manager yielding a fixed response."""
+
+    def __init__(self, response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+class _PostQueue(deque):
+    """Queue of results for the mocked ``session.post``, recording every call."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def post(self, *args, **kwargs):
+        self.calls.append(call(*args, **kwargs))
+        result = self.popleft()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+@pytest.fixture(scope="session")
+def _post_queue(session):
+    """Route the shared session's post through a queue, installed once."""
+    queue = _PostQueue()
+    session.post = queue.post
+    return queue
+
+@pytest.fixture(autouse=True)
+def post_queue(_post_queue):
+    """Provide an empty post queue to each test and check it was drained."""
+    _post_queue.clear()
+    _post_queue.calls.clear()
+    yield _post_queue
+    assert not _post_queue, "mocked post responses were left unused"
+
+_RESP_SPEC = aiohttp.ClientResponse
+
+@pytest.fixture(scope="session")
+def make_post_cm():
+    """Return a factory for mocked ``session.post`` context managers."""
+    def _make_post_cm(status=200, json_body=None):
+        response = MagicMock(spec_set=_RESP_SPEC, status=status)
+        response.configure_mock(read=AsyncMock(return_value=json.dumps(json_body).encode()))
+        return _ACM(response)
+    return _make_post_cm
+
+@pytest.fixture(autouse=True)
+def reset_api_client(api_client):
+    """Reset the shared client's auth and cache state before each test."""
+    api_client._user_id = None
+    api_client._authenticated = False
+    api_client._cached_devices = []
+    api_client._inflight = None
+    api_client._pending_controls.clear()
+    api_client._last_update_monotonic = None
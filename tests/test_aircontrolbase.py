@@ -1,162 +1,245 @@
+import asyncio
 import pytest
 import json
-from unittest.mock import MagicMock, patch, AsyncMock
+from unittest.mock import AsyncMock
 import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from custom_components.aircontrolbase.api import (
-    AirControlBaseAPI, 
-    AirControlBaseAuthError, 
+    AirControlBaseAPI,
+    AirControlBaseAuthError,
     AirControlBaseConnectionError,
-    AirControlBaseError
 )
 
-@pytest.mark.asyncio
-async def test_login_success(api_client):
-    """Test successful login."""
-    mock_response = MagicMock()
-    mock_response.status = 200
-    mock_response.json = AsyncMock(return_value={
-        "code": "200",
-        "result": {"id": "user123"},
-        "msg": "操作成功"
-    })
-    mock_response.headers = MagicMock()
-    mock_response.headers.getall.return_value = ["session_id=xyz"]
-    
-    # Mock the context manager
-    mock_cm = AsyncMock()
-    mock_cm.__aenter__.return_value = mock_response
-    
-    with patch.object(api_client._session, 'post', return_value=mock_cm):
-        await api_client.login()
-        assert api_client._user_id == "user123"
-        assert "session_id=xyz" in api_client._session_id
+# Response bodies shared by the tests below; none of them are mutated
+_LOGIN_OK_BODY = {
+    "code": "200",
+    "result": {"id": "user123"},
+    "msg": "操作成功"
+}
+_UNAUTHORIZED_BODY = {"code": "401", "msg": "Unauthorized"}
+_EXPIRED_BODY = {"code": "401", "msg": "session expired"}
+_CTRL_OK_BODY = {"code": "200", "msg": "操作成功"}
+_DEVICES_BODY = {
+    "code": "200",
+    "result": {
+        "areas": [
+            {
+                "data": [
+                    {"id": "device1", "name": "Living Room AC"},
+                    {"id": "device2", "name": "Bedroom AC"}
+                ]
+            }
+        ]
+    }
+}
+_SINGLE_DEVICE_BODY = {
+    "code": "200",
+    "result": {"areas": [{"data": [{"id": "1"}]}]},
+    "msg": "操作成功"
+}
+
+_CONTROL_OPERATION = {"power": "y", "mode": "cool"}
 
 @pytest.mark.asyncio
-async def test_login_failure(api_client):
-    """Test failed login."""
-    mock_response = MagicMock()
-    mock_response.status = 401
-    mock_response.json = AsyncMock(return_value={"code": "401", "msg": "Unauthorized"})
-    
-    mock_cm = AsyncMock()
-    mock_cm.__aenter__.return_value = mock_response
-    
-    with patch.object(api_client._session, 'post', return_value=mock_cm):
-        with pytest.raises(AirControlBaseAuthError, match="HTTP error 401"):
-            await api_client.login()
+@pytest.mark.parametrize(
+    "method,status,body,raises",
+    [
+        ("login", 200, _LOGIN_OK_BODY, None),
+        ("login", 401, _UNAUTHORIZED_BODY, "HTTP error 401"),
+        ("control_device", 200, _CTRL_OK_BODY, None),
+    ],
+    ids=["login_success", "login_failure", "control_device_success"],
+)
+async def test_post_endpoint(api_client, post_queue, make_post_cm, method, status, body, raises):
+    """Test login and device control against a single mocked response."""
+    if method == "control_device":
+        api_client._user_id = "user123"
+        api_client._authenticated = True
+        call = api_client.control_device(dict(_CONTROL_OPERATION), dict(_CONTROL_OPERATION))
+    else:
+        call = api_client.login()
+
+    post_queue.append(make_post_cm(status, body))
+    if raises:
+        with pytest.raises(AirControlBaseAuthError, match=raises):
+            await call
+        return
+    await call
+
+    assert api_client._user_id == "user123"
+    assert api_client._authenticated is True
+    if method == "control_device":
+        (post_call,) = post_queue.calls
+        assert str(post_call.args[0]) == "https://www.aircontrolbase.com/web/device/control"
+        form_data = post_call.kwargs["data"]
+        assert json.loads(form_data["operation"]) == _CONTROL_OPERATION
+        assert form_data["control"] == form_data["operation"]
 
 @pytest.mark.asyncio
-async def test_login_connection_error(api_client):
+async def test_login_connection_error(api_client, post_queue):
     """Test login connection error (e.g. DNS failure)."""
-    with patch.object(api_client._session, 'post', side_effect=Exception("DNS failure")):
-        with pytest.raises(AirControlBaseConnectionError, match="Authentication failed: DNS failure"):
-            await api_client.login()
+    post_queue.append(aiohttp.ClientConnectionError("DNS failure"))
+    with pytest.raises(AirControlBaseConnectionError, match="Authentication failed: DNS failure"):
+        await api_client.login()
 
 @pytest.mark.asyncio
-async def test_get_devices_success(api_client):
+async def test_get_devices_success(api_client, post_queue, make_post_cm):
     """Test successful device listing."""
     api_client._user_id = "user123"
-    api_client._session_id = "session_id=xyz"
-    
-    mock_response = MagicMock()
-    mock_response.status = 200
-    mock_response.json = AsyncMock(return_value={
-        "code": "200",
-        "result": {
-            "areas": [
-                {
-                    "data": [
-                        {"id": "device1", "name": "Living Room AC"},
-                        {"id": "device2", "name": "Bedroom AC"}
-                    ]
-                }
-            ]
-        }
-    })
-    
-    mock_cm = AsyncMock()
-    mock_cm.__aenter__.return_value = mock_response
-    
-    with patch.object(api_client._session, 'post', return_value=mock_cm):
-        devices = await api_client.get_devices()
-        assert len(devices) == 2
-        assert devices[0]["id"] == "device1"
-        assert devices[1]["name"] == "Bedroom AC"
+    api_client._authenticated = True
+
+    post_queue.append(make_post_cm(200, _DEVICES_BODY))
+    devices = await api_client.get_devices()
+    assert len(devices) == 2
+    assert devices[0]["id"] == "device1"
+    assert devices[1]["name"] == "Bedroom AC"
+
+@pytest.mark.asyncio
+async def test_concurrent_get_devices_share_one_request(api_client, post_queue, make_post_cm):
+    """Test that concurrent get_devices calls are coalesced into one request."""
+    api_client._user_id = "user123"
+    api_client._authenticated = True
+
+    post_queue.append(make_post_cm(200, _SINGLE_DEVICE_BODY))
+    results = await asyncio.gather(*(api_client.get_devices() for _ in range(3)))
+
+    assert len(post_queue.calls) == 1
+    assert all(devices == [{"id": "1"}] for devices in results)
+    assert api_client._inflight is None
 
 @pytest.mark.asyncio
-async def test_control_device_success(api_client):
-    """Test successful device control."""
+async def test_get_devices_returns_cache_inside_debounce_window(api_client, post_queue):
+    """Test that get_devices returns the cached devices right after a control."""
     api_client._user_id = "user123"
-    api_client._session_id = "session_id=xyz"
-    
-    mock_response = MagicMock()
-    mock_response.status = 200
-    mock_response.json = AsyncMock(return_value={"code": "200", "msg": "操作成功"})
-    
-    mock_cm = AsyncMock()
-    mock_cm.__aenter__.return_value = mock_response
-    
-    with patch.object(api_client._session, 'post', return_value=mock_cm):
-        control = {"power": "y", "mode": "cool"}
-        operation = {"power": "y", "mode": "cool"}
-        await api_client.control_device(control, operation)
+    api_client._authenticated = True
+    api_client._cached_devices = [{"id": "device1"}]
+    api_client._last_update_monotonic = asyncio.get_running_loop().time()
+
+    devices = await api_client.get_devices()
+
+    assert post_queue.calls == []
+    assert devices == [{"id": "device1"}]
+    devices.clear()
+    assert api_client._cached_devices == [{"id": "device1"}]
 
 @pytest.mark.asyncio
-async def test_request_retry_on_expired_session(api_client):
+async def test_control_device_batches_rapid_operations(api_client, post_queue, make_post_cm):
+    """Test that rapid operations for one device are merged into one request."""
+    api_client._user_id = "user123"
+    api_client._authenticated = True
+
+    post_queue.append(make_post_cm(200, _CTRL_OK_BODY))
+    await asyncio.gather(
+        api_client.control_device({}, {"id": 1, "setTemp": 22, "mode": "cool"}),
+        api_client.control_device({}, {"id": 1, "setTemp": 23, "mode": "cool"}),
+        api_client.control_device({}, {"id": 1, "setTemp": 23, "wind": "auto"}),
+    )
+
+    (post_call,) = post_queue.calls
+    operation = json.loads(post_call.kwargs["data"]["operation"])
+    assert operation == {"id": 1, "setTemp": 23, "mode": "cool", "wind": "auto"}
+    assert api_client._pending_controls == {}
+
+@pytest.mark.asyncio
+async def test_request_retry_on_expired_session(api_client, post_queue, make_post_cm):
     """Test that a request retries after session expiration."""
     api_client._user_id = "expired_user"
-    api_client._session_id = "expired_session"
-
-    # First response: Session expired (code 401 in body)
-    mock_response_expired = MagicMock()
-    mock_response_expired.status = 200
-    mock_response_expired.json = AsyncMock(return_value={"code": "401", "msg": "session expired"})
-    
-    # Second response (after re-login): Success
-    mock_response_success = MagicMock()
-    mock_response_success.status = 200
-    mock_response_success.json = AsyncMock(return_value={
-        "code": "200", 
-        "result": {"areas": [{"data": [{"id": "1"}]}]},
-        "msg": "操作成功"
-    })
-
-    # Mock login success
-    mock_response_login = MagicMock()
-    mock_response_login.status = 200
-    mock_response_login.json = AsyncMock(return_value={
-        "code": "200",
-        "result": {"id": "new_user"},
-        "msg": "操作成功"
-    })
-    mock_response_login.headers = MagicMock()
-    mock_response_login.headers.getall.return_value = ["new_session"]
-
-    # Set up the mock to return different side effects for each call
-    mock_cm_expired = AsyncMock()
-    mock_cm_expired.__aenter__.return_value = mock_response_expired
-    
-    mock_cm_login = AsyncMock()
-    mock_cm_login.__aenter__.return_value = mock_response_login
-    
-    mock_cm_success = AsyncMock()
-    mock_cm_success.__aenter__.return_value = mock_response_success
-
-    with patch.object(api_client._session, 'post', side_effect=[mock_cm_expired, mock_cm_login, mock_cm_success]):
-        devices = await api_client.get_devices()
-        
-        assert len(devices) == 1
-        assert api_client._user_id == "new_user"
-        assert api_client._session_id == "new_session"
+    api_client._authenticated = True
+
+    # Session expired (code 401 in body), then login success, then the retried request
+    post_queue.extend([
+        make_post_cm(200, _EXPIRED_BODY),
+        make_post_cm(200, _LOGIN_OK_BODY),
+        make_post_cm(200, _SINGLE_DEVICE_BODY),
+    ])
+    devices = await api_client.get_devices()
+
+    assert len(devices) == 1
+    assert api_client._user_id == "user123"
+    assert api_client._authenticated is True
 
 @pytest.mark.asyncio
-async def test_test_connection_success(api_client):
+async def test_get_devices_retries_transient_errors(api_client, post_queue, make_post_cm):
+    """Test that get_devices retries a 503 and that control_device does not."""
+    api_client._user_id = "user123"
+    api_client._authenticated = True
+
+    post_queue.extend([make_post_cm(503), make_post_cm(200, _SINGLE_DEVICE_BODY)])
+    devices = await api_client.get_devices()
+    assert devices == [{"id": "1"}]
+
+    post_queue.calls.clear()
+    post_queue.append(make_post_cm(503))
+    with pytest.raises(AirControlBaseConnectionError, match="HTTP error 503"):
+        await api_client.control_device({}, {"id": 1, "power": "y"})
+    assert len(post_queue.calls) == 1
+
+@pytest.mark.asyncio
+async def test_get_devices_retries_stale_keepalive_connection(api_client, post_queue, make_post_cm):
+    """Test that get_devices retries when the server closed a pooled connection."""
+    api_client._user_id = "user123"
+    api_client._authenticated = True
+
+    post_queue.extend([
+        aiohttp.ServerDisconnectedError(),
+        make_post_cm(200, _SINGLE_DEVICE_BODY),
+    ])
+    devices = await api_client.get_devices()
+
+    assert devices == [{"id": "1"}]
+    assert len(post_queue.calls) == 2
+
+@pytest.mark.asyncio
+async def test_test_connection_success(api_client, monkeypatch):
     """Test connection success."""
-    with patch.object(api_client, 'login', new_callable=AsyncMock) as mock_login, \
-         patch.object(api_client, 'get_devices', new_callable=AsyncMock) as mock_get_devices:
-        
-        mock_get_devices.return_value = [{"id": "1"}]
-        result = await api_client.test_connection()
-        assert result is True
-        mock_login.assert_called_once()
-        mock_get_devices.assert_called_once()
+    monkeypatch.setattr(api_client, 'login', AsyncMock())
+    monkeypatch.setattr(api_client, 'get_devices', AsyncMock(return_value=[{"id": "1"}]))
+
+    assert await api_client.test_connection() is True
+    api_client.login.assert_called_once()
+    api_client.get_devices.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_owned_session_is_pooled_and_closed():
+    """Test that a client without a session creates, reuses and closes its own."""
+    client = AirControlBaseAPI(email="test@example.com", password="password123")
+
+    session = await client._get_session()
+    assert await client._get_session() is session
+    assert session.connector.limit_per_host == 4
+
+    await client.aclose()
+    assert session.closed
+    assert client._session is None
+
+@pytest.mark.asyncio
+async def test_login_cookie_is_sent_to_other_endpoints():
+    """Test that a login cookie set without Path=/ still reaches getDetails."""
+    received_cookies = []
+
+    async def handle_login(request):
+        response = web.json_response(_LOGIN_OK_BODY)
+        response.headers["Set-Cookie"] = "JSESSIONID=abc"
+        return response
+
+    async def handle_details(request):
+        received_cookies.append(request.headers.get("Cookie"))
+        return web.json_response(_SINGLE_DEVICE_BODY)
+
+    app = web.Application()
+    app.router.add_post("/web/user/login", handle_login)
+    app.router.add_post("/web/userGroup/getDetails", handle_details)
+
+    async with TestServer(app, host="localhost") as server:
+        client = AirControlBaseAPI(email="test@example.com", password="password123")
+        client._url_login = server.make_url("/web/user/login")
+        client._url_details = server.make_url("/web/userGroup/getDetails")
+        try:
+            await client.login()
+            devices = await client.get_devices()
+        finally:
+            await client.aclose()
+
+    assert devices == [{"id": "1"}]
+    assert received_cookies == ["JSESSIONID=abc"]